@@ -0,0 +1,152 @@
+# DOCUMENT ARCHIVAL
+
+# ---------------------------------------------------------------------------
+# IMPORT LIBRARIES
+
+import argparse
+import datetime
+import gzip
+import json
+import time
+from typing import Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import OperationalError
+
+from config.variables import ARCHIVE_RETENTION_DAYS, ARCHIVE_BATCH_SIZE
+from database.models import Documents, DocumentsArchive
+from logger import print_error, logger
+
+
+# ---------------------------------------------------------------------------
+# ARCHIVAL
+
+def _archive_batch_statement(cutoff: datetime.datetime, batch_size: int):
+    """
+    Build a DELETE ... RETURNING of one batch of processed documents older than the cutoff.
+
+    Rows are read in processed_at order through documents_processed_idx, so every batch starts at the oldest
+    remaining document instead of rescanning the heap. Locked rows are skipped, so archival does not wait
+    for documents being processed right now.
+    """
+    batch = select(Documents.doc_id).where(
+        Documents.processed_at < cutoff
+    ).order_by(Documents.processed_at).limit(batch_size).with_for_update(skip_locked=True).scalar_subquery()
+
+    return delete(Documents.__table__).where(Documents.doc_id.in_(batch)).returning(*Documents.__table__.columns)
+
+
+def archive_to_table(cutoff: datetime.datetime, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move one batch of processed documents into the documents_archive table.
+
+    Args:
+        cutoff (datetime.datetime): Documents processed before this moment are moved.
+        batch_size (int): Maximum number of documents per batch.
+
+    Returns:
+        int: Number of moved documents.
+    """
+
+    moved = _archive_batch_statement(cutoff, batch_size).cte('moved')
+    columns = [column.name for column in Documents.__table__.columns]
+    statement = insert(DocumentsArchive.__table__).from_select(columns, select(*moved.c)).add_cte(moved)
+
+    session = Documents.get_session()
+    try:
+        count = session.execute(statement).rowcount
+        session.commit()
+        return count
+    except OperationalError as e:
+        print_error(e)
+        time.sleep(3)
+        return archive_to_table(cutoff, batch_size)
+    except Exception as e:
+        print_error(e)
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def archive_to_jsonl(cutoff: datetime.datetime, file: gzip.GzipFile, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move one batch of processed documents into a gzip-compressed JSONL export.
+
+    The batch is written and flushed before the deletion is committed, so a failed commit can only
+    duplicate rows in the export, never lose them.
+
+    Args:
+        cutoff (datetime.datetime): Documents processed before this moment are moved.
+        file (gzip.GzipFile): Export file opened for writing.
+        batch_size (int): Maximum number of documents per batch.
+
+    Returns:
+        int: Number of moved documents.
+    """
+
+    session = Documents.get_session()
+    try:
+        rows = session.execute(_archive_batch_statement(cutoff, batch_size)).mappings().all()
+        for row in rows:
+            file.write((json.dumps(dict(row), default=str, ensure_ascii=False) + '\n').encode('utf-8'))
+        file.flush()
+        session.commit()
+        return len(rows)
+    except OperationalError as e:
+        print_error(e)
+        time.sleep(3)
+        return archive_to_jsonl(cutoff, file, batch_size)
+    except Exception as e:
+        print_error(e)
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def archive_documents(retention_days: int = ARCHIVE_RETENTION_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                      export_path: Optional[str] = None) -> int:
+    """
+    Move processed documents older than the retention window out of the documents table.
+
+    Documents are moved in batches, each batch in its own transaction, into documents_archive
+    or, when export_path is given, into a gzip-compressed JSONL file.
+
+    Args:
+        retention_days (int): Processed documents are kept in the documents table for this many days.
+        batch_size (int): Maximum number of documents per batch.
+        export_path (Optional[str]): Path of the .jsonl.gz export. Defaults to the archive table.
+
+    Returns:
+        int: Total number of moved documents.
+    """
+
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=retention_days)
+    total = 0
+
+    if export_path:
+        with gzip.open(export_path, 'ab') as file:
+            while moved := archive_to_jsonl(cutoff, file, batch_size):
+                total += moved
+                logger.debug(f'Выгружено в {export_path} {total} документов')
+    else:
+        while moved := archive_to_table(cutoff, batch_size):
+            total += moved
+            logger.debug(f'Перенесено в {DocumentsArchive.__tablename__} {total} документов')
+
+    return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Архивация обработанных документов')
+    parser.add_argument('--days', type=int, default=ARCHIVE_RETENTION_DAYS,
+                        help='сколько дней хранить обработанные документы в таблице documents')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                        help='количество документов в одной транзакции')
+    parser.add_argument('--export', default=None,
+                        help='путь к файлу .jsonl.gz, по умолчанию документы переносятся в documents_archive')
+    args = parser.parse_args()
+
+    archived_count = archive_documents(args.days, args.batch_size, args.export)
+    print(f'Архивировано документов: {archived_count}')
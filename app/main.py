@@ -8,9 +8,14 @@ from typing import Optional
 
 from sqlalchemy import or_
 
+from app.profiler import get_profiler
+from database.base_model import PRIMARY
 from database.models import Documents, Data
 from logger import print_error, logger
 
+# None unless PROFILE_ENABLED is set, so processing is not affected when profiling is off
+profiler = get_profiler()
+
 
 # ---------------------------------------------------------------------------
 # DOCUMENT PROCESSING
@@ -26,7 +31,8 @@ def find_non_processed_document(document_type: Optional[str] = 'transfer_documen
            Optional[Documents]: The first document that matches the criteria, or None if no document is found.
     """
 
-    query = Documents.filter(Documents.processed_at == None)
+    # The claimed document is updated right after, so it is read from the primary, not from a lagging replica
+    query = Documents.using(PRIMARY).filter(Documents.processed_at == None)
     if document_type:
         query = query.filter(Documents.document_type == document_type)
 
@@ -99,6 +105,13 @@ def process_document() -> bool:
         bool: True if a document was processed successfully; False otherwise.
     """
 
+    if profiler is not None and profiler.should_sample():
+        with profiler.sampling():
+            return _process_document()
+    return _process_document()
+
+
+def _process_document() -> bool:
     try:
         document = find_non_processed_document()
         if not document:
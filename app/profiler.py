@@ -0,0 +1,183 @@
+# DOCUMENT PROFILER
+
+# ---------------------------------------------------------------------------
+# IMPORT LIBRARIES
+
+import atexit
+import datetime
+import glob
+import os
+import random
+import sys
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config.variables import (PROFILE_ENABLED, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL, PROFILE_TOP_N,
+                              PROFILE_OUTPUT_DIR)
+from logger import logger
+
+# ---------------------------------------------------------------------------
+# CONFIGURATION
+
+# Functions (file name, function name) that open a processing phase, the innermost one found on the stack wins
+PHASE_FUNCTIONS: Dict[Tuple[str, str], str] = {
+    ('main.py', 'find_non_processed_document'): 'claim',
+    ('base_model.py', '_process_json_columns'): 'decode',
+    ('base_model.py', '_process_json_values'): 'decode',
+    ('base_model.py', 'update_all'): 'update',
+    ('base_model.py', 'bulk_update'): 'update',
+    ('base_model.py', 'save'): 'stamp',
+}
+DEFAULT_PHASE = 'process'
+DECODE_MODULE = os.sep + 'json' + os.sep
+
+
+# ---------------------------------------------------------------------------
+# PROFILER
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for document processing.
+
+    While a document is sampled, a background thread periodically captures the stack of the processing
+    thread. Every process writes its stacks into its own file in the runs directory, so parallel workers
+    never overwrite each other. The combined collapsed stacks file (flamegraph.pl, speedscope) and the
+    top-N summary of hot functions per phase are rebuilt from all run files.
+    """
+
+    def __init__(self, sample_rate: float, interval: float, top_n: int, output_dir: str) -> None:
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.top_n = top_n
+        self.output_dir = output_dir
+
+        self.stacks: Counter = Counter()
+        self.sampled_documents = 0
+
+    def should_sample(self) -> bool:
+        """Decide whether the next document is profiled"""
+        return random.random() < self.sample_rate
+
+    @contextmanager
+    def sampling(self) -> Iterator[None]:
+        """Sample the stack of the current thread until the block exits"""
+        target_id = threading.get_ident()
+        stop_event = threading.Event()
+        thread = threading.Thread(target=self._sample_loop, args=(target_id, stop_event), daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop_event.set()
+            thread.join()
+            self.sampled_documents += 1
+
+    def _sample_loop(self, target_id: int, stop_event: threading.Event) -> None:
+        while not stop_event.wait(self.interval):
+            frame = sys._current_frames().get(target_id)
+            if frame is not None:
+                self.stacks[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame) -> Tuple[str, ...]:
+        """Convert a frame into a tuple of 'phase', 'file.py:function', ... ordered from the root"""
+        names: List[str] = []
+        phase: Optional[str] = None
+        while frame is not None:
+            code = frame.f_code
+            function = (os.path.basename(code.co_filename), code.co_name)
+            names.append(f'{function[0]}:{function[1]}')
+            if phase is None:
+                if function in PHASE_FUNCTIONS:
+                    phase = PHASE_FUNCTIONS[function]
+                elif DECODE_MODULE in code.co_filename:
+                    phase = 'decode'
+            frame = frame.f_back
+        names.append(phase or DEFAULT_PHASE)
+        return tuple(reversed(names))
+
+    def write_report(self) -> None:
+        """Write the stacks of this process and rebuild the combined collapsed stacks and top-N summary"""
+        if not self.stacks:
+            return
+
+        runs_dir = os.path.join(self.output_dir, 'runs')
+        os.makedirs(runs_dir, exist_ok=True)
+        run_name = f"{datetime.datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}.collapsed"
+        self._write_atomic(os.path.join(runs_dir, run_name), self._format_collapsed(self.stacks))
+
+        # Run files are only ever replaced as a whole, so they are read complete even while other workers write
+        stacks: Counter = Counter()
+        for path in glob.glob(os.path.join(runs_dir, '*.collapsed')):
+            stacks.update(self._read_collapsed(path))
+
+        collapsed_path = os.path.join(self.output_dir, 'documents.collapsed')
+        summary_path = os.path.join(self.output_dir, 'documents_top.txt')
+        self._write_atomic(collapsed_path, self._format_collapsed(stacks))
+
+        summary = [f'Samples: {sum(stacks.values())}, documents sampled in the last run: '
+                   f'{self.sampled_documents}, interval: {self.interval}s\n']
+        for phase, total, self_counts, total_counts in self._phase_summary(stacks):
+            summary.append(f'\n[{phase}] samples: {total}\n')
+            summary.append(f"{'self':>8} {'total':>8}  function\n")
+            for function, count in total_counts.most_common(self.top_n):
+                summary.append(f'{self_counts[function]:>8} {count:>8}  {function}\n')
+        self._write_atomic(summary_path, summary)
+
+        logger.debug(f'Профиль записан: {collapsed_path}, {summary_path}')
+
+    @staticmethod
+    def _format_collapsed(stacks: Counter) -> List[str]:
+        return [f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common()]
+
+    @staticmethod
+    def _write_atomic(path: str, lines: List[str]) -> None:
+        """Write into a temporary file next to the target and replace the target with it"""
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(path),
+                                         suffix='.tmp', delete=False) as file:
+            file.writelines(lines)
+        os.replace(file.name, path)
+
+    @staticmethod
+    def _read_collapsed(path: str) -> Counter:
+        """Read stacks of one run file, malformed lines are skipped"""
+        stacks: Counter = Counter()
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    stacks[tuple(stack.split(';'))] += int(count)
+        return stacks
+
+    @staticmethod
+    def _phase_summary(stacks: Counter) -> List[Tuple[str, int, Counter, Counter]]:
+        """Aggregate self and inclusive sample counts of every function per phase"""
+        phases: Dict[str, Tuple[Counter, Counter]] = {}
+        totals: Counter = Counter()
+        for stack, count in stacks.items():
+            phase, functions = stack[0], stack[1:]
+            self_counts, total_counts = phases.setdefault(phase, (Counter(), Counter()))
+            totals[phase] += count
+            self_counts[functions[-1]] += count
+            for function in set(functions):
+                total_counts[function] += count
+
+        return [(phase, total, *phases[phase]) for phase, total in totals.most_common()]
+
+
+def get_profiler() -> Optional[SamplingProfiler]:
+    """Create the profiler when profiling is enabled, the report is written when the process exits"""
+    if not PROFILE_ENABLED:
+        return None
+
+    profiler = SamplingProfiler(
+        sample_rate=PROFILE_SAMPLE_RATE,
+        interval=PROFILE_INTERVAL,
+        top_n=PROFILE_TOP_N,
+        output_dir=PROFILE_OUTPUT_DIR
+    )
+    atexit.register(profiler.write_report)
+    return profiler
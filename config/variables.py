@@ -3,6 +3,7 @@
 # ---------------------------------------------------------------------------
 # IMPORT LIBRARIES
 import os
+from typing import Optional
 
 from dotenv import load_dotenv
 
@@ -22,6 +23,24 @@ DB_USER = os.getenv('DB_USER', 'user')
 DB_PASSWORD = os.getenv('DB_PASSWORD', 'password')
 DB_PORT = int(os.getenv('DB_PORT', '5432'))
 
+# Optional read replica, reads are routed to the primary when DB_REPLICA_HOST is not set
+DB_REPLICA_HOST = os.getenv('DB_REPLICA_HOST')
+DB_REPLICA_NAME = os.getenv('DB_REPLICA_NAME', DB_NAME)
+DB_REPLICA_USER = os.getenv('DB_REPLICA_USER', DB_USER)
+DB_REPLICA_PASSWORD = os.getenv('DB_REPLICA_PASSWORD', DB_PASSWORD)
+DB_REPLICA_PORT = int(os.getenv('DB_REPLICA_PORT', str(DB_PORT)))
+
+# Opt-in sampling profiler of document processing, see app/profiler.py
+PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '1.0'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+PROFILE_TOP_N = int(os.getenv('PROFILE_TOP_N', '20'))
+PROFILE_OUTPUT_DIR = os.getenv('PROFILE_OUTPUT_DIR', 'profiles')
+
+# Archival of processed documents, see app/archive.py
+ARCHIVE_RETENTION_DAYS = int(os.getenv('ARCHIVE_RETENTION_DAYS', '30'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '5000'))
+
 # ---------------------------------------------------------------------------
 # DATABASE
 
@@ -36,4 +55,16 @@ DATABASE_INFO = {
     }
 }
 
+if DB_REPLICA_HOST:
+    DATABASE_INFO['replica'] = {
+        'database': DB_REPLICA_NAME,
+        'host': DB_REPLICA_HOST,
+        'user': DB_REPLICA_USER,
+        'password': DB_REPLICA_PASSWORD,
+        'port': DB_REPLICA_PORT
+    }
+
 database: DatabaseConfig = DatabaseConfig(database_info=DATABASE_INFO)
+replica_database: Optional[DatabaseConfig] = (
+    DatabaseConfig(database_info=DATABASE_INFO, database_name='replica') if 'replica' in DATABASE_INFO else None
+)
@@ -5,11 +5,14 @@
 import ast
 import json
 import time
-from typing import List, TypeVar, Generic, Type, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List, Tuple, TypeVar, Generic, Type, Optional
 
+from sqlalchemy import String, and_, cast, column, inspect, update, values
 from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.exc import OperationalError
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import declarative_base, defer, load_only
 
 from database.database_config import DatabaseConfig
 from logger import print_error
@@ -20,13 +23,73 @@ from logger import print_error
 T = TypeVar('T', bound='BaseModel')
 Base = declarative_base()
 
+# Database aliases accepted by the `using` argument of read methods
+PRIMARY = 'primary'
+REPLICA = 'replica'
+
+# Maximum number of primary keys sent in one IN (...) list by BaseModel.get_many
+GET_MANY_CHUNK_SIZE = 1000
+
+# Maximum number of rows sent in one UPDATE ... FROM (VALUES ...) by BaseModel.bulk_update
+BULK_UPDATE_CHUNK_SIZE = 1000
+
+
+def _process_json_values(columns: tuple, rows: Iterable[tuple]) -> List[tuple]:
+    """Convert JSON and JSONB values of selected columns the same way as _process_json_columns does"""
+    processed_results: List[tuple] = []
+    for row in rows:
+        processed_row: List[object] = []
+        for column, value in zip(columns, row):
+            if isinstance(column.type, JSON):
+                if isinstance(value, str):
+                    try:
+                        value = ast.literal_eval(value)
+                    except Exception as e:
+                        print_error(e)
+                elif value is None:
+                    value = {}
+            processed_row.append(value)
+        processed_results.append(tuple(processed_row))
+    return processed_results
+
+
+def _unsized_type(column_type):
+    """
+    Drop the length of string types for casts of VALUES columns.
+
+    An explicit cast to varchar(n) silently truncates longer values, while an assignment without it raises
+    "value too long", so bulk_update casts to plain varchar and leaves the length check to the assignment.
+    """
+    if isinstance(column_type, String):
+        return column_type.__class__()
+    return column_type
+
+
+# State shared by nested BaseModel.read_your_writes() blocks, None outside of them
+_read_your_writes_state: ContextVar[Optional[dict]] = ContextVar('read_your_writes_state', default=None)
+
+
+def _mark_write() -> None:
+    """Remember a committed write, so the following reads of the read_your_writes block go to the primary"""
+    state = _read_your_writes_state.get()
+    if state is not None:
+        state['written'] = True
+
 
 # ---------------------------------------------------------------------------------------------------------------------
 # Helper class for building query chains
 class QuerySet(Generic[T]):
-    def __init__(self, query, session):
+    def __init__(self, query, session, model: Type[T]):
         self.query = query
         self.session = session
+        self.model = model
+
+    def using(self, alias: str) -> "QuerySet[T]":
+        """Run the query on the given database alias (PRIMARY or REPLICA)"""
+        self.session.close()
+        self.session = self.model.get_read_session(alias)
+        self.query = self.query.with_session(self.session)
+        return self
 
     def filter(self, *args, **kwargs) -> "QuerySet[T]":
         self.query = self.query.filter(*args, **kwargs)
@@ -36,6 +99,50 @@ class QuerySet(Generic[T]):
         self.query = self.query.order_by(*args)
         return self
 
+    def only(self, *columns) -> "QuerySet[T]":
+        """
+        Load only the given columns, the remaining ones are deferred.
+
+        Deferred columns are not available once the instance is returned,
+        because the session is closed after the query is executed.
+        """
+        self.query = self.query.options(load_only(*columns))
+        return self
+
+    def defer(self, *columns) -> "QuerySet[T]":
+        """Exclude the given columns from loading, e.g. large JSONB payloads"""
+        self.query = self.query.options(*(defer(column) for column in columns))
+        return self
+
+    def values_list(self, *columns, flat: bool = False) -> List:
+        """
+        Retrieve selected columns, respecting filters and ordering of the query set.
+
+        Args:
+            *columns: Columns to select.
+            flat (bool): Return plain values instead of one-element tuples. Requires a single column.
+
+        Returns:
+            List: List of tuples, or list of values if flat is True.
+        """
+        if flat and len(columns) != 1:
+            raise ValueError('flat=True requires exactly one column')
+
+        try:
+            results = _process_json_values(columns, self.query.with_entities(*columns).all())
+            if flat:
+                return [row[0] for row in results]
+            return results
+        except OperationalError as e:
+            print_error(e)
+            time.sleep(3)
+            return self.values_list(*columns, flat=flat)
+        except Exception as e:
+            print_error(e)
+            return []
+        finally:
+            self.session.close()
+
     def all(self) -> List[T]:
         try:
             results = self.query.all()
@@ -73,8 +180,14 @@ class QuerySet(Generic[T]):
 # MAIN LOGIC
 
 class BaseModel(Base, Generic[T]):
-    """Base model for all database objects with common methods"""
+    """
+    Base model for all database objects with common methods.
+
+    Writes always go to __database__ (the primary). Reads go to __replica__ when it is configured,
+    unless the call passes using=PRIMARY or a write has already happened inside read_your_writes().
+    """
     __database__: DatabaseConfig = None
+    __replica__: Optional[DatabaseConfig] = None
     __abstract__ = True
     __table_args__ = {'extend_existing': True, 'schema': 'public'}
 
@@ -83,9 +196,37 @@ class BaseModel(Base, Generic[T]):
         return cls.__database__.get_session()
 
     @classmethod
-    def get(cls: Type[T], pk: object) -> Optional[T]:
+    def get_read_session(cls, using: Optional[str] = None):
+        """Return a session for read queries on the given alias or on the routed database"""
+        if using is None:
+            state = _read_your_writes_state.get()
+            using = PRIMARY if state is not None and state['written'] else REPLICA
+
+        if using == PRIMARY or (using == REPLICA and cls.__replica__ is None):
+            return cls.get_session()
+        if using == REPLICA:
+            return cls.__replica__.get_session()
+        raise ValueError(f'Unknown database alias: {using}')
+
+    @classmethod
+    @contextmanager
+    def read_your_writes(cls) -> Iterator[None]:
+        """
+        Route all reads to the primary after the first write made inside the block.
+
+        Nested blocks share the state of the outermost one, so a write seen by any of them routes the reads
+        of all of them to the primary.
+        """
+        token = _read_your_writes_state.set(_read_your_writes_state.get() or {'written': False})
+        try:
+            yield
+        finally:
+            _read_your_writes_state.reset(token)
+
+    @classmethod
+    def get(cls: Type[T], pk: object, using: Optional[str] = None) -> Optional[T]:
         """Retrieve an instance by primary key"""
-        session = cls.get_session()
+        session = cls.get_read_session(using)
         try:
             instance: Optional[T] = session.query(cls).get(pk)
             if instance:
@@ -94,22 +235,62 @@ class BaseModel(Base, Generic[T]):
         except OperationalError as e:
             print_error(e)
             time.sleep(3)
-            return cls.get(pk)
+            return cls.get(pk, using)
         except Exception as e:
             print_error(e)
         finally:
             session.close()
         return None
 
+    @classmethod
+    def get_many(cls: Type[T], pks: Iterable[object], chunk_size: int = GET_MANY_CHUNK_SIZE,
+                 using: Optional[str] = None) -> Dict[object, T]:
+        """
+        Retrieve instances by a list of primary keys using chunked IN (...) queries.
+
+        Args:
+            pks (Iterable[object]): Primary keys to look up. Duplicates are fetched once.
+            chunk_size (int): Maximum number of keys per query.
+            using (Optional[str]): Database alias, routed automatically by default.
+
+        Returns:
+            Dict[object, T]: Found instances keyed by primary key. Missing keys are absent.
+        """
+        pk_column = cls._get_primary_key_column()
+        pks = list(dict.fromkeys(pks))
+        session = cls.get_read_session(using)
+        try:
+            instances: Dict[object, T] = {}
+            for start in range(0, len(pks), chunk_size):
+                chunk = pks[start:start + chunk_size]
+                for instance in session.query(cls).filter(pk_column.in_(chunk)).all():
+                    cls._process_json_columns(instance)
+                    instances[getattr(instance, pk_column.key)] = instance
+            return instances
+        except OperationalError as e:
+            print_error(e)
+            time.sleep(3)
+            return cls.get_many(pks, chunk_size, using)
+        except Exception as e:
+            print_error(e)
+        finally:
+            session.close()
+        return {}
+
     @classmethod
     def all(cls: Type[T]) -> List[T]:
         return cls.query_set().all()
 
     @classmethod
-    def query_set(cls) -> QuerySet[T]:
-        session = cls.get_session()
+    def query_set(cls, using: Optional[str] = None) -> QuerySet[T]:
+        session = cls.get_read_session(using)
         query = session.query(cls)
-        return QuerySet(query, session)
+        return QuerySet(query, session, cls)
+
+    @classmethod
+    def using(cls: Type[T], alias: str) -> QuerySet[T]:
+        """Returns a query set bound to the given database alias (PRIMARY or REPLICA)"""
+        return cls.query_set(alias)
 
     @classmethod
     def filter(cls: Type[T], *args, **kwargs) -> QuerySet[T]:
@@ -121,6 +302,16 @@ class BaseModel(Base, Generic[T]):
         """Returns a query set with order_by applied, allowing further calls to .all() or .first()"""
         return cls.query_set().order_by(*args)
 
+    @classmethod
+    def only(cls: Type[T], *columns) -> QuerySet[T]:
+        """Returns a query set loading only the given columns"""
+        return cls.query_set().only(*columns)
+
+    @classmethod
+    def defer(cls: Type[T], *columns) -> QuerySet[T]:
+        """Returns a query set that does not load the given columns"""
+        return cls.query_set().defer(*columns)
+
     @classmethod
     def first(cls: Type[T], *args, **kwargs) -> Optional[T]:
         """Convenient method to immediately retrieve the first object matching the filter"""
@@ -128,30 +319,15 @@ class BaseModel(Base, Generic[T]):
 
     # Other methods remain unchanged
     @classmethod
-    def values(cls: Type[T], *columns) -> List[tuple]:
+    def values(cls: Type[T], *columns, using: Optional[str] = None) -> List[tuple]:
         """Retrieve selected columns from the database"""
-        session = cls.get_session()
+        session = cls.get_read_session(using)
         try:
-            results = session.query(*columns).all()
-            processed_results: List[tuple] = []
-            for row in results:
-                processed_row: List[object] = []
-                for column, value in zip(columns, row):
-                    if isinstance(column.type, JSON):
-                        if isinstance(value, str):
-                            try:
-                                value = ast.literal_eval(value)
-                            except Exception as e:
-                                print_error(e)
-                        elif value is None:
-                            value = {}
-                    processed_row.append(value)
-                processed_results.append(tuple(processed_row))
-            return processed_results
+            return _process_json_values(columns, session.query(*columns).all())
         except OperationalError as e:
             print_error(e)
             time.sleep(3)
-            return cls.values(*columns)
+            return cls.values(*columns, using=using)
         except Exception as e:
             print_error(e)
         finally:
@@ -164,6 +340,7 @@ class BaseModel(Base, Generic[T]):
         try:
             session.delete(self)
             session.commit()
+            _mark_write()
         except OperationalError as e:
             print_error(e)
             time.sleep(3)
@@ -186,6 +363,7 @@ class BaseModel(Base, Generic[T]):
         try:
             session.add_all(instances)
             session.commit()
+            _mark_write()
             for instance in instances:
                 session.refresh(instance)
             return instances
@@ -206,6 +384,7 @@ class BaseModel(Base, Generic[T]):
         try:
             session.add(self)
             session.commit()
+            _mark_write()
             session.refresh(self)
             return self
         except OperationalError as e:
@@ -220,9 +399,9 @@ class BaseModel(Base, Generic[T]):
             session.close()
 
     @classmethod
-    def count(cls: Type[T], *args, **kwargs) -> int:
+    def count(cls: Type[T], *args, using: Optional[str] = None, **kwargs) -> int:
         """Return the count of records matching the filter or the total number of records"""
-        session = cls.get_session()
+        session = cls.get_read_session(using)
         try:
             query = session.query(cls)
             if args or kwargs:
@@ -231,7 +410,7 @@ class BaseModel(Base, Generic[T]):
         except OperationalError as e:
             print_error(e)
             time.sleep(3)
-            return cls.count(*args, **kwargs)
+            return cls.count(*args, using=using, **kwargs)
         except Exception as e:
             print_error(e)
         finally:
@@ -246,6 +425,7 @@ class BaseModel(Base, Generic[T]):
                 update_values, synchronize_session=False
             )
             session.commit()
+            _mark_write()
             return count
         except OperationalError as e:
             print_error(e)
@@ -258,12 +438,108 @@ class BaseModel(Base, Generic[T]):
         finally:
             session.close()
 
+    @classmethod
+    def bulk_update(cls, rows: Iterable[Tuple[object, dict]], old_values: Optional[dict] = None,
+                    chunk_size: int = BULK_UPDATE_CHUNK_SIZE) -> List[int]:
+        """
+        Apply different new values to many rows with one UPDATE ... FROM (VALUES ...) per chunk.
+
+        Rows are grouped by the set of updated columns, every chunk is committed separately.
+        Column names are validated before anything is executed. When a primary key occurs
+        several times, only its last entry is applied.
+
+        Args:
+            rows (Iterable[Tuple[object, dict]]): Pairs of (primary key, {column: new value}).
+            old_values (Optional[dict]): Guards as {column: old value or list of old values},
+                rows not matching them are left untouched.
+            chunk_size (int): Maximum number of rows per statement.
+
+        Returns:
+            List[int]: Number of updated records for every executed chunk.
+
+        Raises:
+            ValueError: If a column is unknown or is the primary key.
+        """
+        pk_column = cls._get_primary_key_column()
+        # Later entries replace earlier ones, so a target row is never matched by two VALUES rows
+        latest_values: Dict[object, dict] = dict(rows)
+
+        updated_columns = {name for new_values in latest_values.values() for name in new_values}
+        unknown_columns = (updated_columns | set(old_values or {})) - set(cls.__table__.c.keys())
+        if unknown_columns:
+            raise ValueError(f'Unknown columns of {cls.__tablename__}: {", ".join(sorted(unknown_columns))}')
+        if pk_column.name in updated_columns:
+            raise ValueError(f'Primary key {pk_column.name} can not be updated by bulk_update')
+
+        groups: Dict[Tuple[str, ...], List[tuple]] = {}
+        for pk, new_values in latest_values.items():
+            if not new_values:
+                continue
+            columns = tuple(sorted(new_values))
+            groups.setdefault(columns, []).append((pk, *(new_values[name] for name in columns)))
+
+        counts: List[int] = []
+        for columns, group_rows in groups.items():
+            for start in range(0, len(group_rows), chunk_size):
+                counts.append(cls._bulk_update_chunk(columns, group_rows[start:start + chunk_size], old_values))
+        return counts
+
+    @classmethod
+    def _bulk_update_chunk(cls, columns: Tuple[str, ...], chunk: List[tuple], old_values: Optional[dict]) -> int:
+        """Execute a single UPDATE ... FROM (VALUES ...) statement for bulk_update"""
+        table = cls.__table__
+        pk_column = cls._get_primary_key_column()
+
+        new_rows = values(
+            column('pk', pk_column.type),
+            *(column(name, table.c[name].type) for name in columns),
+            name='new_rows'
+        ).data(chunk)
+
+        # Casts are required because PostgreSQL types VALUES columns of NULLs as text
+        conditions = [pk_column == cast(new_rows.c.pk, _unsized_type(pk_column.type))]
+        for name, old_value in (old_values or {}).items():
+            if isinstance(old_value, list):
+                conditions.append(table.c[name].in_(old_value))
+            else:
+                conditions.append(table.c[name] == old_value)
+
+        statement = update(table).where(and_(*conditions)).values(
+            {name: cast(new_rows.c[name], _unsized_type(table.c[name].type)) for name in columns}
+        )
+
+        session = cls.get_session()
+        try:
+            count = session.execute(statement).rowcount
+            session.commit()
+            _mark_write()
+            return count
+        except OperationalError as e:
+            print_error(e)
+            time.sleep(3)
+            return cls._bulk_update_chunk(columns, chunk, old_values)
+        except Exception as e:
+            print_error(e)
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    @classmethod
+    def _get_primary_key_column(cls):
+        """Return the primary key column, composite primary keys are not supported"""
+        if len(cls.__mapper__.primary_key) != 1:
+            raise ValueError(f'{cls.__name__} must have a single-column primary key')
+        return cls.__mapper__.primary_key[0]
+
     @classmethod
     def _process_json_columns(cls, instance: T) -> None:
         """Process JSON and JSONB columns for one instance"""
+        # Deferred columns are skipped, otherwise accessing them would load them anyway
+        unloaded = inspect(instance).unloaded
         for column in instance.__table__.columns:
             try:
-                if isinstance(column.type, JSON):
+                if isinstance(column.type, JSON) and column.name not in unloaded:
                     data = getattr(instance, column.name)
                     if isinstance(data, str):
                         setattr(instance, column.name, ast.literal_eval(data))
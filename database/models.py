@@ -2,14 +2,14 @@
 
 # ---------------------------------------------------------------------------------------------------------------------
 # IMPORT LIBRARIES
+from typing import Optional
 
-
-from sqlalchemy import Column, Integer, String, DateTime
-from sqlalchemy import create_engine, Engine, inspect
+from sqlalchemy import Column, Integer, String, DateTime, Index, text
+from sqlalchemy import create_engine, Connection, Engine, inspect
 from sqlalchemy.dialects.postgresql import JSONB
 
-from config.variables import database
-from database.base_model import BaseModel
+from config.variables import database, replica_database
+from database.base_model import BaseModel, PRIMARY
 from database.data_filler import make_data, make_documents
 from database.database_config import DatabaseConfig
 
@@ -20,6 +20,7 @@ from database.database_config import DatabaseConfig
 class Data(BaseModel):
     __tablename__ = 'data'
     __database__: DatabaseConfig = database
+    __replica__: Optional[DatabaseConfig] = replica_database
 
     object = Column(String(50), primary_key=True)
     status = Column(Integer)
@@ -28,10 +29,8 @@ class Data(BaseModel):
     owner = Column(String(14))
 
 
-class Documents(BaseModel):
-    __tablename__ = 'documents'
-    __database__: DatabaseConfig = database
-
+class DocumentColumns:
+    """Columns shared by Documents and DocumentsArchive, app.archive copies rows between them by column name"""
     doc_id = Column(String, primary_key=True)
     recieved_at = Column(DateTime)
     document_type = Column(String)
@@ -39,14 +38,78 @@ class Documents(BaseModel):
     processed_at = Column(DateTime, nullable=True)
 
 
+class Documents(DocumentColumns, BaseModel):
+    __tablename__ = 'documents'
+    __database__: DatabaseConfig = database
+    __replica__: Optional[DatabaseConfig] = replica_database
+
+    # The pending index covers only the queue, so its lookup does not grow with the processed history.
+    # The processed index lets app.archive read batches in processed_at order instead of scanning the heap.
+    # Both are built concurrently, so create_tables does not block processing on an existing table.
+    __table_args__ = (
+        Index('documents_pending_idx', 'document_type', 'recieved_at',
+              postgresql_where=text('processed_at IS NULL'), postgresql_concurrently=True),
+        Index('documents_processed_idx', 'processed_at',
+              postgresql_where=text('processed_at IS NOT NULL'), postgresql_concurrently=True),
+        BaseModel.__table_args__,
+    )
+
+
+class DocumentsArchive(DocumentColumns, BaseModel):
+    """Processed documents moved out of the documents table by app.archive"""
+    __tablename__ = 'documents_archive'
+    __database__: DatabaseConfig = database
+    __replica__: Optional[DatabaseConfig] = replica_database
+
+
 # ---------------------------------------------------------------------------------------------------------------------
 # CREATE AND FILL TABLES
 
-def fill_tables(model, data_tbl, documents_tbl):
+def fill_tables(model, data_tbl, documents_tbl) -> bool:
     if model.__tablename__ == 'data':
         model.add_all([Data(**i) for i in data_tbl])
     elif model.__tablename__ == 'documents':
         model.add_all([Documents(**i) for i in documents_tbl])
+    else:
+        return False
+    return True
+
+
+def get_index_validity(connection: Connection, index: Index) -> Optional[bool]:
+    """Return pg_index.indisvalid of the index, or None if the index does not exist"""
+    return connection.execute(
+        text(
+            'SELECT i.indisvalid FROM pg_index i '
+            'JOIN pg_class c ON c.oid = i.indexrelid '
+            'JOIN pg_namespace n ON n.oid = c.relnamespace '
+            'WHERE c.relname = :name AND n.nspname = :schema'
+        ),
+        {'name': index.name, 'schema': index.table.schema or 'public'}
+    ).scalar()
+
+
+def create_indexes(model, connection: Connection) -> None:
+    """
+    Create indexes added to the model after its table was created.
+
+    Indexes are built with CREATE INDEX CONCURRENTLY, so processing is not blocked. An interrupted
+    concurrent build leaves an INVALID index, which is dropped and built again.
+    """
+    table_name = model.__tablename__
+    for index in model.__table__.indexes:
+        is_valid = get_index_validity(connection, index)
+        if is_valid:
+            continue
+
+        action = 'Пересоздать невалидный' if is_valid is False else 'Создать'
+        question = f'{action} индекс {index.name} таблицы {table_name} (CREATE INDEX CONCURRENTLY)? [Y/N] '
+        if input(question).upper() != 'Y':
+            continue
+
+        if is_valid is False:
+            index.drop(bind=connection)
+        index.create(bind=connection)
+        print(f'Индекс {index.name} создан!')
 
 
 def create_tables():
@@ -55,21 +118,26 @@ def create_tables():
     documents_tbl = make_documents(data)
 
     for model in BaseModel.__subclasses__():
-        engine: Engine = create_engine(model.__database__.get_engine_url(), pool_pre_ping=True)
+        # CREATE INDEX CONCURRENTLY can not run inside a transaction block
+        engine: Engine = create_engine(model.__database__.get_engine_url(), pool_pre_ping=True,
+                                       isolation_level='AUTOCOMMIT')
         inspector = inspect(engine)
         table_name = model.__tablename__
 
         if not inspector.has_table(table_name):
             if input(f'Создать таблицу {table_name}? [Y/N] ').upper() == 'Y':
-                model.__table__.create(bind=engine, checkfirst=True)
+                with engine.connect() as connection:
+                    model.__table__.create(bind=connection, checkfirst=True)
                 print(f'Таблица {table_name} создана!')
 
-                fill_tables(model, data_tbl, documents_tbl)
-                print(f'Таблица {table_name} заполнена данными.')
+                if fill_tables(model, data_tbl, documents_tbl):
+                    print(f'Таблица {table_name} заполнена данными.')
 
         else:
-            if model.count() == 0:
-                fill_tables(model, data_tbl, documents_tbl)
+            with engine.connect() as connection:
+                create_indexes(model, connection)
+
+            if model.count(using=PRIMARY) == 0 and fill_tables(model, data_tbl, documents_tbl):
                 print(f'Таблица {table_name} существует, но была пуста. Теперь она заполнена данными.')
 
 